@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import time
+
+from profiling import tracer
+
+API_URL = "https://api.openai.com/v1/chat/completions"
+# Statuses worth retrying; 429 also tells the limiter to back off.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on in-flight API requests, adjusted from throttling and errors.
+
+    Every successful request raises the limit by 1/limit (about one more request per round trip). A 429, server
+    error, timeout or network error multiplies the limit by `backoff`. Other failures, such as a 4xx or a cancelled
+    request, are counted as errors but leave the limit alone. Latency is not used as a congestion signal:
+    LLM latency mostly follows the length of the output, not load. Decreases happen at most once per round trip
+    (the smoothed latency) so a burst of failures from the same window only counts once.
+
+    Args:
+        initial_limit (int, optional): Starting number of concurrent requests.
+        min_limit (int, optional): Lower bound for the limit.
+        max_limit (int, optional): Upper bound for the limit.
+        backoff (float, optional): Factor the limit is multiplied by on a decrease.
+        smoothing (float, optional): Weight of the newest sample in the smoothed latency.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, backoff=0.5, smoothing=0.2):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._condition = None
+        self._loop = None
+
+    def _get_condition(self):
+        # asyncio primitives belong to one event loop; scripts may call asyncio.run more than once
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < max(self.min_limit, int(self.limit)))
+            self.in_flight += 1
+
+    def _decrease(self, now):
+        if now - self._last_decrease < (self.latency_ewma or 0):
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._last_decrease = now
+
+    async def release(self, latency, error=False, throttled=False, failed=False):
+        """
+        Free a slot and adjust the limit from the outcome of the request that held it.
+
+        `throttled` (429) and `error` (server error, timeout or network error) are congestion signals. `failed` marks
+        any other unsuccessful request, which neither raises the limit nor counts as a latency sample.
+        """
+        now = time.monotonic()
+        self.requests += 1
+        if throttled or error:
+            self.throttled += throttled
+            self.errors += error
+            self._decrease(now)
+        elif failed:
+            self.errors += 1
+        else:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.smoothing * (latency - self.latency_ewma)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def metrics(self):
+        """Current limit and counters, e.g. for logging at the end of a run."""
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'latency_ewma': self.latency_ewma,
+        }
+
+
+# Shared by every script so all API calls of a process count against the same limit.
+limiter = AdaptiveConcurrencyLimiter()
+
+
+# Session kept open by shared_session(); None means every call opens its own.
+_session = None
+
+
+@contextlib.asynccontextmanager
+async def shared_session():
+    """Keep one HTTP connection pool open for every call made inside the block, e.g. in a long-running worker."""
+    global _session
+    import aiohttp
+
+    _session = aiohttp.ClientSession()
+    try:
+        yield _session
+    finally:
+        session, _session = _session, None
+        await session.close()
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return 2 ** attempt
+
+
+async def call_gpt_api(prompt, api_key, model="gpt-4", temperature=0.7, response_format=None, max_retries=3):
+    """
+    Call OpenAI GPT API asynchronously, within the shared adaptive concurrency limit.
+
+    Throttled (429) and server errors are retried up to `max_retries` times, honouring Retry-After.
+    """
+    # Imported here so scripts that never call the API don't pay for importing aiohttp
+    import aiohttp
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+    }
+    if response_format is not None:
+        payload["response_format"] = response_format
+
+    for attempt in range(max_retries + 1):
+        with tracer.span('api_wait', category='network'):
+            await limiter.acquire()
+        start = time.monotonic()
+        status = None
+        error = False
+        try:
+            with tracer.span('api_call', category='network', model=model, attempt=attempt):
+                async with contextlib.AsyncExitStack() as stack:
+                    session = _session or await stack.enter_async_context(aiohttp.ClientSession())
+                    async with session.post(API_URL, headers=headers, json=payload) as response:
+                        status = response.status
+                        if status == 200:
+                            data = await response.json()
+                            return data["choices"][0]["message"]["content"]
+                        error_text = await response.text()
+                        delay = _retry_delay(response, attempt)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            error = True
+            raise
+        finally:
+            # Anything but a 200 (a 4xx, or no status at all after a cancellation) is not a success
+            await limiter.release(time.monotonic() - start, error=error or (status is not None and status >= 500),
+                                  throttled=status == 429, failed=status != 200)
+
+        if status not in RETRY_STATUSES or attempt == max_retries:
+            raise Exception(f"Error: {status}, {error_text}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict, defaultdict
+
+SIMHASH_BITS = 64
+# Four 16-bit bands: two fingerprints within 3 bits of each other always share at least one band.
+SIMHASH_BANDS = 4
+SHINGLE_SIZE = 3
+
+
+def normalize_chunk(chunk_text):
+    """Lowercase and strip punctuation so formatting differences don't defeat matching."""
+    return re.findall(r'\w+', chunk_text.lower())
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(words, shingle_size=SHINGLE_SIZE):
+    """64-bit SimHash fingerprint of the word shingles of a chunk."""
+    if len(words) < shingle_size:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class ChunkDedupIndex:
+    """
+    Index of chunks already sent for extraction, keyed by exact hash and SimHash fingerprint.
+
+    Each entry keeps the extraction result of the first chunk seen and the paths of every chunk that matched it,
+    so repeated paragraphs (plan footers, HSA restrictions, ...) are only sent to the LLM once. Concurrent callers
+    should use get_or_extract, which also shares calls that are still in flight.
+
+    Args:
+        max_distance (int, optional): Largest SimHash Hamming distance that counts as a near-duplicate.
+        max_entries (int, optional): Keep at most this many entries, evicting the least recently used, e.g. in a
+            long-running worker. Unbounded if None.
+        exact_only (bool, optional): Only match exact (normalized) duplicates. Use this for whole documents: a few
+            bits of SimHash distance are a small edit for a chunk but can hide whole paragraphs in a long page.
+    """
+
+    def __init__(self, max_distance=3, max_entries=None, exact_only=False):
+        band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        if max_distance >= SIMHASH_BANDS:
+            raise ValueError(f"max_distance must be below {SIMHASH_BANDS} for {band_bits}-bit bands.")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.exact_only = exact_only
+        # Digest -> entry, least recently used first
+        self.exact = OrderedDict()
+        self.bands = [defaultdict(list) for _ in range(SIMHASH_BANDS)]
+        self.hits = 0
+        self.misses = 0
+
+    def _band_keys(self, fingerprint):
+        band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        mask = (1 << band_bits) - 1
+        return [(fingerprint >> (band * band_bits)) & mask for band in range(SIMHASH_BANDS)]
+
+    def find(self, chunk_text):
+        """Return the entry of an exact or near-duplicate chunk, or None."""
+        words = normalize_chunk(chunk_text)
+        digest = hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+        entry = self.exact.get(digest)
+
+        if entry is None and words and not self.exact_only:
+            fingerprint = simhash(words)
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                for candidate in self.bands[band].get(key, ()):
+                    if bin(candidate['fingerprint'] ^ fingerprint).count('1') <= self.max_distance:
+                        entry = candidate
+                        break
+                if entry is not None:
+                    break
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.exact.move_to_end(entry['digest'])
+        return entry
+
+    def add(self, chunk_text, result, path=None):
+        """Record the extraction result of a chunk that was sent to the LLM."""
+        words = normalize_chunk(chunk_text)
+        digest = hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+        fingerprint = None if self.exact_only or not words else simhash(words)
+        entry = {'digest': digest, 'fingerprint': fingerprint, 'result': result,
+                 'paths': [path] if path is not None else []}
+        if digest in self.exact:
+            self.remove(self.exact[digest])
+        self.exact[digest] = entry
+        if fingerprint is not None:
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                self.bands[band][key].append(entry)
+        if self.max_entries is not None:
+            while len(self.exact) > self.max_entries:
+                self.remove(next(iter(self.exact.values())))
+        return entry
+
+    def remove(self, entry):
+        """Forget an entry, e.g. one whose extraction failed or that was evicted."""
+        if self.exact.get(entry['digest']) is not entry:
+            return
+        del self.exact[entry['digest']]
+        if entry['fingerprint'] is None:
+            return
+        for band, key in enumerate(self._band_keys(entry['fingerprint'])):
+            candidates = [other for other in self.bands[band].get(key, ()) if other is not entry]
+            if candidates:
+                self.bands[band][key] = candidates
+            else:
+                self.bands[band].pop(key, None)
+
+    async def get_or_extract(self, chunk_text, extract, path=None):
+        """
+        Return the extraction result of a chunk, awaiting `extract()` only if no matching chunk was seen before.
+
+        The entry is recorded with a future before the call is awaited, so duplicates that arrive while it is in
+        flight (e.g. a footer repeated within one document) wait for that call instead of sending their own. If the
+        call fails, the entry is removed and the waiting duplicates fail with the same error.
+        """
+        entry = self.find(chunk_text)
+        if entry is not None:
+            self.attach(entry, path)
+            if isinstance(entry['result'], asyncio.Future):
+                # Shielded so a cancelled duplicate doesn't cancel the call it is waiting for
+                return await asyncio.shield(entry['result'])
+            return entry['result']
+
+        future = asyncio.get_running_loop().create_future()
+        entry = self.add(chunk_text, future, path)
+        try:
+            result = await extract()
+        except BaseException as e:
+            self.remove(entry)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the error as retrieved in case no duplicate is waiting for it
+                future.exception()
+            raise
+        entry['result'] = result
+        future.set_result(result)
+        return result
+
+    def attach(self, entry, path):
+        """Attach the path of a duplicate chunk to an existing entry."""
+        if path is not None and path not in entry['paths']:
+            entry['paths'].append(path)
@@ -1,52 +1,21 @@
-import aiohttp
-import pandas as pd
 from collections import defaultdict, Counter
 import asyncio
 import re
 
-def split_document_into_chunks(document_text, chunk_size=2000):
-    chunks = []
-    current_chunk = []
-
-    # Accumulate words into a chunk until the size limit is reached
-    for word in document_text.split():
-        if sum(len(s) for s in current_chunk) + len(word) + len(current_chunk) <= chunk_size:
-            current_chunk.append(word)
-        else:
-            # Add the current chunk to the list and start a new chunk
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-
-    # Add the final chunk if any words remain
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-
-    return chunks
-
-async def call_gpt_api(prompt, api_key):
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-4",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                error = await response.text()
-                raise Exception(f"Error: {response.status}, {error}")
+import api_client
+from chunk_dedup import ChunkDedupIndex
+from preprocessing import create_executor, read_and_preprocess_file
+from profiling import tracer
+from topic_descriptions import MAX_CONTEXTS_PER_TOPIC, TopicDescriber
+from structured_output import STRUCTURED_MODEL, STRUCTURED_TEMPERATURE, TOPIC_LIST_RESPONSE_FORMAT, parse_topics
+
+async def call_gpt_api(prompt, api_key, temperature=0.7, response_format=None, model=None):
+    return await api_client.call_gpt_api(prompt, api_key, model=model or "gpt-4", temperature=temperature,
+                                         response_format=response_format)
 
 # 
 
-async def extract_topics(section_text, api_key):
+async def extract_topics(section_text, api_key, structured=False):
     prompt = (
         """
             "Given a text section that is potentially relevant to answering users' questions about benefits options and a list of entity types, "
@@ -111,17 +80,14 @@ async def extract_topics(section_text, api_key):
         """ 
         f"{section_text}"
     )
+    if structured:
+        # Schema-constrained, deterministic output: no free-text line parsing
+        response = await call_gpt_api(prompt, api_key, temperature=STRUCTURED_TEMPERATURE,
+                                      response_format=TOPIC_LIST_RESPONSE_FORMAT, model=STRUCTURED_MODEL)
+        return parse_topics(response)
     response = await call_gpt_api(prompt, api_key)
     return [topic.strip() for topic in response.strip().split('\n') if topic.strip()]
 
-async def generate_topic_description(topic, section_text, api_key):
-    prompt = (
-        f"Generate a concise, medium-sized description of the topic '{topic}' using the context from the following section:\n\n"
-        f"{section_text}"
-    )
-    response = await call_gpt_api(prompt, api_key)
-    return response.strip()
-
 async def extract_top_topics(topics, api_key):
     prompt = (
         "Here is a list of topics. Identify the 25 most important, broad, and overarching topics that are potentially relevant to answering user questions about benefits options. DONT ADD ANY TOPICS. ONLY THE TOPICS GIVEN TO YOU IN THE LIST. If there are not 25 topics in the input, just return the topics."
@@ -145,23 +111,37 @@ async def main():
     # test cases
     
 
-    # Read the document content
-    with open(file_path, 'r', encoding='utf-8') as file:
-        document_text = file.read()
-        print("File read.")
-
-    # Step 1: Split document into logical sections
-    sections = split_document_into_chunks(document_text, chunk_size=2000)
-    print("Document split into chunks.")
-
-    # Step 2: Extract topics for each section
-    topic_dict = {}
-    for section_text in sections:
-        topics = await extract_topics(section_text, api_key)
-        print("Topics extracted.")
-        for topic in topics:
-            if topic not in topic_dict:  # Avoid duplicates
-                topic_dict[topic] = {}  # Initialize topic with an empty dict
+    # Step 1: Read, clean and split the documents into logical sections in worker processes
+    with create_executor() as executor:
+        pending = [(path, tracer.run_in_executor(executor, 'preprocess', read_and_preprocess_file, path, 2000))
+                   for path in file_paths]
+
+        # Step 2: Extract topics for each section, reusing results for repeated sections
+        topic_dict = {}
+        chunk_index = ChunkDedupIndex()
+        for path, future in pending:
+            with tracer.span('preprocess', path=path):
+                sections = await future
+            print(f"{path} cleaned and split into chunks.")
+            for section_text in sections:
+                duplicate = chunk_index.find(section_text)
+                if duplicate is not None:
+                    chunk_index.attach(duplicate, path)
+                    topics = duplicate['result']
+                else:
+                    topics = await extract_topics(section_text, api_key)
+                    chunk_index.add(section_text, topics, path)
+                    print("Topics extracted.")
+                for topic in topics:
+                    if topic not in topic_dict:  # Avoid duplicates
+                        topic_dict[topic] = {'path': [], 'sections': []}
+                    if path not in topic_dict[topic]['path']:
+                        topic_dict[topic]['path'].append(path)
+                    # Keep a little section context for describing the topic later
+                    if len(topic_dict[topic]['sections']) < MAX_CONTEXTS_PER_TOPIC:
+                        topic_dict[topic]['sections'].append(section_text)
+
+    print(f"Skipped {chunk_index.hits} duplicate chunks, extracted {chunk_index.misses}.")
 
     print("Topics in topic_dict:")
     for topic in topic_dict.keys():
@@ -183,5 +163,14 @@ async def main():
     for topic in top_topics:
         print(topic)
 
+    # Step 5: Describe only the top topics, several per call, from the sections they were extracted from
+    describer = TopicDescriber(call_gpt_api)
+    contexts = {topic: details['sections'] for topic, details in topic_dict.items()}
+    descriptions = await describer.describe(top_topics, contexts, api_key)
+
+    print("\nTop topic descriptions:")
+    for topic, description in descriptions.items():
+        print(f"{topic}: {description}")
+
 if __name__ == "__main__":
     asyncio.run(main())
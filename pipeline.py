@@ -0,0 +1,112 @@
+import asyncio
+import inspect
+
+from profiling import tracer
+
+# Marks the end of a stage's input.
+_DONE = object()
+
+
+class Stage:
+    """
+    A single pipeline stage.
+
+    Args:
+        name (str): Stage name, used in error messages.
+        func (callable): Coroutine function or plain function applied to each item. Plain functions run in `executor`
+            (the default thread pool if None) so they never block the event loop.
+        kind (str, optional): 'map' emits one output per item, 'flat_map' emits every item of the returned iterable,
+            'reduce' waits for all items and calls `func` once with the list of them.
+        workers (int, optional): Number of items processed concurrently. Ignored for 'reduce' stages.
+        executor (Executor, optional): Executor for plain functions, e.g. a process pool for CPU-bound work.
+    """
+
+    def __init__(self, name, func, kind='map', workers=1, executor=None):
+        if kind not in ('map', 'flat_map', 'reduce'):
+            raise ValueError(f"Unknown stage kind: {kind}")
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.workers = 1 if kind == 'reduce' else workers
+        self.executor = executor
+
+    async def apply(self, item):
+        with tracer.span(self.name):
+            if inspect.iscoroutinefunction(self.func):
+                return await self.func(item)
+            return await tracer.run_in_executor(self.executor, self.name, self.func, item)
+
+
+class Pipeline:
+    """
+    Staged producer/consumer pipeline over bounded asyncio queues.
+
+    Every stage runs as soon as its first input arrives, so reading, preprocessing and API calls overlap instead of
+    running as barriers. Bounded queues apply backpressure: a fast stage waits once `maxsize` items are pending
+    downstream. Only 'reduce' stages wait for all of their input.
+    """
+
+    def __init__(self, stages, maxsize=8):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = stages
+        self.maxsize = maxsize
+
+    async def _run_stage(self, stage, inbox, outbox):
+        if stage.kind == 'reduce':
+            items = []
+            while (item := await inbox.get()) is not _DONE:
+                items.append(item)
+            try:
+                result = await stage.apply(items)
+            except Exception as e:
+                raise RuntimeError(f"Stage '{stage.name}' failed: {e}") from e
+            await outbox.put(result)
+            return
+
+        while (item := await inbox.get()) is not _DONE:
+            try:
+                result = await stage.apply(item)
+            except Exception as e:
+                raise RuntimeError(f"Stage '{stage.name}' failed: {e}") from e
+            if stage.kind == 'flat_map':
+                for output in result:
+                    await outbox.put(output)
+            else:
+                await outbox.put(result)
+        # Let the other workers of this stage see the end of input too
+        await inbox.put(_DONE)
+
+    async def _run_workers(self, stage, inbox, outbox):
+        await asyncio.gather(*(self._run_stage(stage, inbox, outbox) for _ in range(stage.workers)))
+        await outbox.put(_DONE)
+
+    async def _feed(self, items, queue):
+        for item in items:
+            await queue.put(item)
+        await queue.put(_DONE)
+
+    async def run(self, items):
+        """Run every item through the pipeline and return the list of outputs of the last stage."""
+        queues = [asyncio.Queue(maxsize=self.maxsize) for _ in range(len(self.stages))]
+        # The final queue is drained by the collector below, so it is unbounded.
+        queues.append(asyncio.Queue())
+
+        results = []
+
+        async def collect():
+            while (item := await queues[-1].get()) is not _DONE:
+                results.append(item)
+
+        tasks = [asyncio.create_task(self._feed(items, queues[0])), asyncio.create_task(collect())]
+        for i, stage in enumerate(self.stages):
+            tasks.append(asyncio.create_task(self._run_workers(stage, queues[i], queues[i + 1])))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On failure, stop every other stage instead of leaving them blocked on their queues
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return results
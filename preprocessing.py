@@ -0,0 +1,107 @@
+import html
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Markdown images and links, e.g. ![alt](src) and [text](https://... "title")
+IMAGE_PATTERN = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+LINK_PATTERN = re.compile(r'\[([^\]]*)\]\((?:[^()\s]|\([^)]*\))*(?:\s+"[^"]*")?\)')
+BARE_URL_PATTERN = re.compile(r'https?://\S+')
+HTML_BLOCK_PATTERN = re.compile(r'<(script|style|nav|header|footer)\b.*?</\1>', re.IGNORECASE | re.DOTALL)
+HTML_BREAK_PATTERN = re.compile(r'</?(p|br|div|li|tr|h[1-6])\b[^>]*>', re.IGNORECASE)
+# Only real tags and comments, so plain-text comparisons like "<$50,000" and ">$50,000" survive
+HTML_TAG_PATTERN = re.compile(r'<!--.*?-->|</?[A-Za-z][\w-]*(\s[^<>]*)?/?>', re.DOTALL)
+EMPHASIS_PATTERN = re.compile(r'(?<!\w)(\*\*|__|\*|_)(?=\S)(.+?)(?<=\S)\1(?!\w)')
+
+# Lines that are navigation or page chrome rather than content.
+BOILERPLATE_PATTERNS = [
+    re.compile(r'^(skip to (main )?content|back to top|print this page|share this page)$', re.IGNORECASE),
+    re.compile(r'^(home|menu|search|log ?in|sign ?in|contact us|site map|main navigation)$', re.IGNORECASE),
+    re.compile(r'^(copyright|©|\(c\)).*$', re.IGNORECASE),
+    re.compile(r'^([-*_]\s*){3,}$'),
+]
+
+
+def clean_document(document_text):
+    """Strip HTML/markdown markup, collapse links to their text and drop boilerplate navigation lines."""
+    text = HTML_BLOCK_PATTERN.sub(' ', document_text)
+    text = HTML_BREAK_PATTERN.sub('\n', text)
+    text = HTML_TAG_PATTERN.sub('', text)
+    text = html.unescape(text).replace('\xa0', ' ')
+
+    text = IMAGE_PATTERN.sub('', text)
+    text = LINK_PATTERN.sub(r'\1', text)
+    text = BARE_URL_PATTERN.sub('', text)
+    text = EMPHASIS_PATTERN.sub(r'\2', text)
+
+    lines = []
+    for line in text.splitlines():
+        # Keep headings and bullets as plain text
+        line = line.strip().lstrip('#').strip()
+        if line.startswith(('* ', '- ', '+ ')):
+            line = line[2:].strip()
+        if not line:
+            continue
+        if any(pattern.match(line) for pattern in BOILERPLATE_PATTERNS):
+            continue
+        # Link-only lines left empty after collapsing, e.g. "| | |"
+        if not re.search(r'\w', line):
+            continue
+        lines.append(' '.join(line.split()))
+    return '\n'.join(lines)
+
+
+def split_document_into_chunks(document_text, chunk_size=2000):
+    """Split the document into reasonable-sized chunks of approximately `chunk_size` characters, breaking at spaces."""
+    chunks = []
+    current_chunk = []
+    current_length = 0
+
+    # Accumulate words into a chunk until the size limit is reached
+    for word in document_text.split():
+        if current_length + len(word) + len(current_chunk) <= chunk_size:
+            current_chunk.append(word)
+            current_length += len(word)
+        else:
+            # Add the current chunk to the list and start a new chunk
+            chunks.append(' '.join(current_chunk))
+            current_chunk = [word]
+            current_length = len(word)
+
+    # Add the final chunk if any words remain
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+
+    return chunks
+
+
+def preprocess_document(document_text, chunk_size=2000):
+    """Clean a raw document and split it into chunks. Runs in a worker process."""
+    return split_document_into_chunks(clean_document(document_text), chunk_size=chunk_size)
+
+
+def read_and_preprocess_file(path, chunk_size=None):
+    """Read a file and clean it, optionally chunking it. Runs in a worker process."""
+    with open(path, "r", encoding="utf-8") as file:
+        text = clean_document(file.read())
+    if chunk_size is None:
+        return text
+    return split_document_into_chunks(text, chunk_size=chunk_size)
+
+
+def read_topic_table(file_path):
+    """Parse a hot topics HTML table into (topic, content) pairs with cleaned content. Runs in a worker process."""
+    import pandas as pd
+
+    df = pd.read_html(file_path)[0]
+    return [(topic, clean_document(str(content))) for topic, content in zip(df['topic'], df['content'])]
+
+
+def create_executor(max_workers=None, start_method=None):
+    """
+    Process pool for CPU-bound preprocessing so it never runs on the event loop thread.
+
+    `start_method` (e.g. 'forkserver') selects how worker processes are started; the platform default if None.
+    """
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
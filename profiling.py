@@ -0,0 +1,195 @@
+import asyncio
+import atexit
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import threading
+import time
+from functools import partial
+
+# Opt-in: set TOPIC_TRACE to a file path to record a Chrome trace (open it in chrome://tracing or Perfetto), and
+# TOPIC_PROFILE_DIR to a directory to also write one cProfile .prof file per stage.
+TRACE_ENV = "TOPIC_TRACE"
+PROFILE_DIR_ENV = "TOPIC_PROFILE_DIR"
+
+
+class Tracer:
+    """
+    Records spans for pipeline stages and API calls as Chrome trace events.
+
+    Spans are attributed to the thread and asyncio task they run in, so concurrent API calls show up as parallel
+    tracks. Work sent to a process pool is traced from the parent, as the time spent waiting on the pool; with
+    run_in_executor it is profiled inside the worker process and its stats are sent back to the parent.
+
+    Args:
+        path (str, optional): Trace file to write. Tracing is disabled if None.
+        profile_dir (str, optional): Directory for per-stage cProfile output of synchronous work: executor calls
+            and 'cpu' spans.
+    """
+
+    def __init__(self, path=None, profile_dir=None):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.enabled = path is not None
+        self.events = []
+        self.stats = {}
+        self._tracks = {}
+        self._start = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        tracer = cls(os.environ.get(TRACE_ENV), os.environ.get(PROFILE_DIR_ENV))
+        if tracer.enabled or tracer.profile_dir:
+            atexit.register(tracer.save)
+        return tracer
+
+    def _track(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = (threading.get_ident(), id(task) if task is not None else None)
+        with self._lock:
+            return self._tracks.setdefault(key, len(self._tracks) + 1)
+
+    @contextlib.contextmanager
+    def span(self, name, category='stage', **args):
+        """
+        Record the wall time of the enclosed block. A no-op unless tracing is enabled.
+
+        'cpu' spans wrap synchronous work on the event loop, e.g. prompt formatting and response parsing, so they
+        are also profiled under `name`.
+        """
+        with contextlib.ExitStack() as stack:
+            if category == 'cpu':
+                stack.enter_context(self.profile(name))
+            if not self.enabled:
+                yield
+                return
+            with self._record(name, category, args):
+                yield
+
+    @contextlib.contextmanager
+    def _record(self, name, category, args):
+        track = self._track()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start - self._start) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': os.getpid(),
+                'tid': track,
+                'args': args,
+            })
+
+    def _add_stats(self, name, profile):
+        with self._lock:
+            if name in self.stats:
+                self.stats[name].add(profile)
+            else:
+                self.stats[name] = pstats.Stats(profile)
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        """Run the enclosed block under cProfile, accumulating its stats under `name`, if profiling is on."""
+        if not self.profile_dir:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread; run unprofiled
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._add_stats(name, profiler)
+
+    def run_in_executor(self, executor, name, func, *args):
+        """
+        Like loop.run_in_executor, but when profiling is on `func` runs under cProfile in the worker thread or
+        process and its stats are accumulated under `name`.
+
+        Returns:
+            asyncio.Future: Future of the result of `func`.
+        """
+        loop = asyncio.get_running_loop()
+        if not self.profile_dir:
+            return loop.run_in_executor(executor, func, *args)
+        future = loop.run_in_executor(executor, partial(_profiled_call, func, *args))
+
+        async def unwrap():
+            result, stats = await future
+            if stats is not None:
+                self._add_stats(name, _RemoteProfile(stats))
+            return result
+
+        return asyncio.ensure_future(unwrap())
+
+    def reset(self):
+        """Drop everything recorded so far, e.g. what a forked worker process inherited from its parent."""
+        with self._lock:
+            self.events = []
+            self.stats = {}
+            self._tracks = {}
+
+    def save(self, suffix=None):
+        """
+        Write the trace file and per-stage profiles.
+
+        Args:
+            suffix (str, optional): Added to every file name, e.g. a worker id so worker processes don't overwrite
+                each other's output.
+        """
+        if self.enabled:
+            path = self.path
+            if suffix:
+                root, ext = os.path.splitext(path)
+                path = f"{root}-{suffix}{ext}"
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for name, stats in self.stats.items():
+                file_name = f"{name}-{suffix}.prof" if suffix else f"{name}.prof"
+                stats.dump_stats(os.path.join(self.profile_dir, file_name))
+
+
+def _profiled_call(func, *args):
+    """Executor entry point: call `func` under cProfile and return its result with the raw profile stats."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args), None
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+class _RemoteProfile:
+    """Profile stats collected in a worker process, in the form pstats.Stats loads from a profiler."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+tracer = Tracer.from_env()
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import copy
+import glob
+import hashlib
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+from chunk_dedup import ChunkDedupIndex
+from preprocessing import read_and_preprocess_file
+from profiling import tracer
+from topic_store import RANKINGS, TopicStore
+
+# Claims older than this are assumed to belong to a dead worker and are handed out again.
+CLAIM_TIMEOUT = 30 * 60
+
+
+def shard_for(path, num_shards):
+    """Stable shard of a path, the same on every host."""
+    return int(hashlib.sha1(path.encode('utf-8')).hexdigest(), 16) % num_shards
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of input files, standing in for a real distributed work queue.
+
+    Every worker process, local or on another host sharing the database file, claims files with an immediate
+    transaction, so a file is only processed by one worker at a time.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work ("
+                "path TEXT PRIMARY KEY, shard INTEGER, status TEXT, worker TEXT, claimed_at REAL, error TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def enqueue(self, paths, num_shards=1):
+        """Add files to the queue; files already queued keep their status."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO work (path, shard, status) VALUES (?, ?, 'pending')",
+                [(path, shard_for(path, num_shards)) for path in paths],
+            )
+
+    def claim(self, worker, shard=None):
+        """Claim the next pending file, optionally only from one shard. Returns None when there is no work left."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE work SET status = 'pending', worker = NULL WHERE status = 'claimed' AND claimed_at < ?",
+                (time.time() - CLAIM_TIMEOUT,),
+            )
+            query = "SELECT path FROM work WHERE status = 'pending'"
+            params = ()
+            if shard is not None:
+                query += " AND shard = ?"
+                params = (shard,)
+            row = conn.execute(query + " LIMIT 1", params).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE work SET status = 'claimed', worker = ?, claimed_at = ? WHERE path = ?",
+                    (worker, time.time(), row[0]),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return row[0] if row is not None else None
+
+    def complete(self, path):
+        with self._connect() as conn:
+            conn.execute("UPDATE work SET status = 'done', error = NULL WHERE path = ?", (path,))
+
+    def fail(self, path, error):
+        with self._connect() as conn:
+            conn.execute("UPDATE work SET status = 'failed', error = ? WHERE path = ?", (str(error), path))
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+
+
+async def _extract_standard(module, path, state, api_key):
+    text = read_and_preprocess_file(path)
+    output = {}
+    # Work on a copy so a file that fails partway doesn't leave its entities behind as reference
+    reference_important_entities = copy.deepcopy(state['reference_important_entities'])
+    names = await module.extract_document_topics(path, text, output, reference_important_entities,
+                                                 state['chunk_index'], api_key=api_key)
+    if names is None:
+        raise Exception("Failed to extract topics.")
+    state['reference_important_entities'] = reference_important_entities
+    # Repeated documents only return the names of the earlier extraction
+    for name in names:
+        output.setdefault(name, {})
+    # Count each topic once per file, like the pipeline's merge stage
+    for details in output.values():
+        details['path'] = [path]
+    return output
+
+
+async def _extract_optimized(module, path, state, api_key):
+    output = {}
+    for section_text in read_and_preprocess_file(path, chunk_size=2000):
+        topics = await state['chunk_index'].get_or_extract(
+            section_text, lambda: module.extract_topics(section_text, api_key), path
+        )
+        for topic in topics:
+            # Count each topic once per file, like the pipeline's merge stage
+            output.setdefault(topic, {'path': [path]})
+    return output
+
+
+async def run_worker(queue_path, out_dir, approach='standard', shard=None, api_key=None):
+    """
+    Claim files from the queue until it is empty, writing this worker's topics to a partial index in `out_dir`.
+
+    The partial index is saved after every file, so a crashed worker loses at most the file it was working on.
+    """
+    if approach == 'standard':
+        import standard_standalone as module
+        extract = _extract_standard
+    else:
+        import optimized_approach_no_cleaning as module
+        extract = _extract_optimized
+
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(queue_path)
+    os.makedirs(out_dir, exist_ok=True)
+    partial_index = TopicStore(os.path.join(out_dir, f"partial-{worker}.json"))
+    # Per-worker extraction state: reference entities and the chunk dedup index carry over between this worker's files
+    # The standard approach indexes whole documents, which are only deduplicated when they match exactly
+    state = {'reference_important_entities': {}, 'chunk_index': ChunkDedupIndex(exact_only=approach == 'standard')}
+
+    while (path := queue.claim(worker, shard=shard)) is not None:
+        try:
+            output = await extract(module, path, state, api_key)
+        except Exception as e:
+            # Nothing from a failed file reaches the partial index
+            print(f"WARNING: Failed to process {path}: {e}")
+            queue.fail(path, e)
+            continue
+        partial_index.merge(output)
+        partial_index.save()
+        queue.complete(path)
+        print(f"{worker}: {path} done.")
+
+
+async def reduce_partials(out_dir, store_path, approach='standard', api_key=None, top_k=25, rank_by='frequency'):
+    """
+    Merge every partial index in `out_dir` into `store_path`, then run clean_top_topics once over the result.
+
+    The merged store is saved as is; the cleaned topic list only filters the returned ranking, so a blank or
+    unrecognised cleaning response leaves the ranking unchanged and never drops topics from the store.
+    """
+    if approach == 'standard':
+        import standard_with_cleaning as module
+    else:
+        import optimized_approach_with_cleaning as module
+
+    store = TopicStore(store_path)
+    for partial_path in sorted(glob.glob(os.path.join(out_dir, "partial-*.json"))):
+        store.merge_store(TopicStore(partial_path))
+    store.save()
+
+    cleaned_topics = [topic for topic in await module.clean_top_topics("\n".join(store.topics), api_key)
+                      if topic in store.topics]
+    if not cleaned_topics:
+        # A blank response means no topics were similar enough to drop
+        return store.top(top_k, by=rank_by)
+    return store.top(top_k, by=rank_by, names=cleaned_topics)
+
+
+def _worker_process(queue_path, out_dir, approach, shard, api_key):
+    # multiprocessing children exit without running atexit handlers, so each worker saves its own trace
+    tracer.reset()
+    try:
+        asyncio.run(run_worker(queue_path, out_dir, approach=approach, shard=shard, api_key=api_key))
+    finally:
+        if tracer.enabled or tracer.profile_dir:
+            tracer.save(suffix=f"{socket.gethostname()}-{os.getpid()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded topic extraction over a SQLite work queue.")
+    parser.add_argument('--queue', default='work_queue.db', help="Work queue database, shared by all workers.")
+    parser.add_argument('--out', default='partials', help="Directory for the workers' partial topic indexes.")
+    parser.add_argument('--approach', choices=('standard', 'optimized'), default='standard')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help="Add input files to the queue.")
+    enqueue.add_argument('file_paths', nargs='+')
+    enqueue.add_argument('--num-shards', type=int, default=1)
+
+    worker = commands.add_parser('worker', help="Process files from the queue until it is empty.")
+    worker.add_argument('--processes', type=int, default=1)
+    worker.add_argument('--shard', type=int, help="Only claim files from this shard.")
+
+    reduce = commands.add_parser('reduce', help="Merge the partial indexes and clean the topics once.")
+    reduce.add_argument('store_path')
+    reduce.add_argument('--top', type=int, default=25)
+    reduce.add_argument('--by', choices=RANKINGS, default='frequency')
+
+    args = parser.parse_args()
+    # API key for OpenAI
+    api_key = os.environ.get("OPENAI_API_KEY")
+
+    if args.command == 'enqueue':
+        queue = WorkQueue(args.queue)
+        queue.enqueue(args.file_paths, num_shards=args.num_shards)
+        print(queue.counts())
+    elif args.command == 'worker':
+        processes = [
+            multiprocessing.Process(target=_worker_process,
+                                    args=(args.queue, args.out, args.approach, args.shard, api_key))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print(WorkQueue(args.queue).counts())
+    else:
+        top_topics = asyncio.run(reduce_partials(args.out, args.store_path, approach=args.approach, api_key=api_key,
+                                                 top_k=args.top, rank_by=args.by))
+        print(f"Top {args.top} topics by {args.by}:")
+        for topic in top_topics:
+            print(topic)
+
+if __name__ == "__main__":
+    main()
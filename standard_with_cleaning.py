@@ -1,30 +1,20 @@
-import aiohttp
 import asyncio
+import inspect
 import json
 
-async def call_gpt_api(prompt, api_key):
+import api_client
+from chunk_dedup import ChunkDedupIndex
+from preprocessing import create_executor, read_and_preprocess_file
+from profiling import tracer
+from topic_descriptions import TopicDescriber, describe_output
+from structured_output import STRUCTURED_MODEL, STRUCTURED_TEMPERATURE, entity_response_format, parse_entities
+
+async def call_gpt_api(prompt, api_key, temperature=0.7, response_format=None, model=None):
     """
     Call OpenAI GPT API asynchronously.
     """
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-4",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                error = await response.text()
-                raise Exception(f"Error: {response.status}, {error}")
+    return await api_client.call_gpt_api(prompt, api_key, model=model or "gpt-4", temperature=temperature,
+                                         response_format=response_format)
 
 async def clean_top_topics(topics, api_key):
     """
@@ -37,23 +27,7 @@ async def clean_top_topics(topics, api_key):
     response = await call_gpt_api(prompt, api_key)
     return [topic.strip() for topic in response.strip().split('\n') if topic.strip()]
 
-async def async_summarize_doc_in_topics(file_contents, index, max_topics=20,
-                                        max_input_length=None, max_completion_tokens=None, topic_thd=0, api_key=None):
-    """
-    Asynchronously extract topics from already-read file contents.
-
-    Args:
-        file_contents (list): List of (path, contents) of files to extract topics from.
-        max_topics (int, optional): Maximum number of topics to extract.
-        max_input_length (int, optional): Maximum input length for the GPT model.
-        max_completion_tokens (int, optional): Maximum tokens for the GPT model's response.
-        topic_thd (float, optional): Threshold for including a topic based on score.
-        api_key (str, required): API key for accessing the GPT API.
-
-    Returns:
-        dict: Extracted topics.
-    """
-    GRAPH_EXTRACTION_JSON_PROMPT = """-Goal- Given a text document that is potentially relevant to answering users' \
+GRAPH_EXTRACTION_JSON_PROMPT = """-Goal- Given a text document that is potentially relevant to answering users' \
     questions about benefits options and a list of entity types, Identify the most important entities of those types \
     from the text, focusing on those that are crucial to understanding the text. \
     Limit your output to the top-{max_topics} entities. The entities must be distinct and non-overlapping. \
@@ -73,7 +47,7 @@ async def async_summarize_doc_in_topics(file_contents, index, max_topics=20,
 
     - entity_name: Name of the entity
     - entity_type: One of the following types: [{entity_types}]
-    - entity_description: Comprehensive description of the entity's attributes and activities, in a medium-sized paragraph
+    - entity_description: {description_instruction}
     - relevance_score: A score between 0 and 1, indicating the relevance of the entity to the text
 
     Format each entity output as a JSON entry with the following format:
@@ -98,7 +72,7 @@ async def async_summarize_doc_in_topics(file_contents, index, max_topics=20,
     ######################
     output:"""
 
-    examples = """
+EXAMPLES = """
     Example 1: 
     Entity_types: plan, recipient group, service provider
     Reference_important_entities: { "Health Savings Account": { "type": "plan",   "description": "A Health Savings Account (HSA) is a tax-advantaged savings account."}}
@@ -148,86 +122,169 @@ python
        "score": 0.3}
     ]
     """
-    reference_important_entities = {}
-    output = {}
-    entity_types = ['plan', 'recipient group', 'service provider']
 
-    for path, text in file_contents:
+ENTITY_TYPES = ['plan', 'recipient group', 'service provider']
+ENTITY_RESPONSE_FORMAT = entity_response_format(ENTITY_TYPES)
+FULL_DESCRIPTION = "Comprehensive description of the entity's attributes and activities, in a medium-sized paragraph"
+# Used when descriptions are generated lazily for the surviving topics only
+SHORT_DESCRIPTION = "A short phrase of at most fifteen words identifying the entity"
+
+async def extract_document_topics(path, text, output, reference_important_entities, chunk_index, max_topics=20,
+                                  topic_thd=0, api_key=None, structured=False, describe_entities=True):
+    """
+    Extract topics from the contents of a single file and merge them into `output`.
+
+    Args:
+        path (str): Path of the file, recorded for each extracted topic.
+        text (str): Contents of the file.
+        output (dict): Topics extracted so far, updated in place.
+        reference_important_entities (dict): Entities passed to the model as reference, updated in place.
+        chunk_index (ChunkDedupIndex): Index of already-extracted contents. Whole documents are matched, so it
+            should be created with exact_only=True.
+        max_topics (int, optional): Maximum number of topics to extract.
+        topic_thd (float, optional): Threshold for including a topic based on score.
+        api_key (str, required): API key for accessing the GPT API.
+        structured (bool, optional): Request schema-constrained JSON at zero temperature and validate it.
+        describe_entities (bool, optional): Ask for full paragraph descriptions. If False, only a short phrase is
+            requested and descriptions are expected to be generated later with describe_output.
+
+    Returns:
+        list: Names of the topics extracted from the file, or None if extraction failed.
+    """
+    # Repeated pages reuse the earlier extraction and only attach their path
+    duplicate = chunk_index.find(text)
+    if duplicate is not None:
+        chunk_index.attach(duplicate, path)
+        for name in duplicate['result']:
+            if name in output and path not in output[name]['path']:
+                output[name]['path'].append(path)
+        return duplicate['result']
+
+    with tracer.span('prompt_format', category='cpu'):
         inp = GRAPH_EXTRACTION_JSON_PROMPT.format(
-            entity_types=entity_types,
+            entity_types=ENTITY_TYPES,
             reference_important_entities=json.dumps(reference_important_entities, indent=4),
             max_topics=max_topics,
-            examples=examples,
+            examples=EXAMPLES,
             input_text=text,
+            description_instruction=FULL_DESCRIPTION if describe_entities else SHORT_DESCRIPTION,
         )
 
-        # Attempt to extract topics with retries if necessary
-        for _ in range(5):  # Retry loop
-            try:
+    # Attempt to extract topics with retries if necessary
+    for _ in range(5):  # Retry loop
+        try:
+            if structured:
+                response = await call_gpt_api(inp, api_key, temperature=STRUCTURED_TEMPERATURE,
+                                              response_format=ENTITY_RESPONSE_FORMAT, model=STRUCTURED_MODEL)
+                with tracer.span('parse_response', category='cpu'):
+                    parsed_data = parse_entities(response, ENTITY_TYPES)
+            else:
                 response = await call_gpt_api(inp, api_key)
-                response = response.strip().strip('python').strip('\n').strip()
-                parsed_data = json.loads(response)
-                print(parsed_data)
-                for entry in parsed_data:
-                    name = entry.get("name")
-                    plan_type = entry.get("type")
-                    content = entry.get("description")
-                    score = entry.get("score")
-
-                    if name is not None and plan_type in entity_types and content is not None and score is not None:
-                        name = name.strip()
-                        if score > topic_thd:
-                            if name in output:
-                                output[name]['path'].append(path)
-                                output[name]['content'].append(content)
-                                # Use the last three descriptions to avoid overwhelmed context
-                                reference_important_entities[name]['description'] = output[name]['content'][-3:]
-                            else:
-                                output[name] = {}
-                                output[name]['path'] = [path]
-                                output[name]['content'] = [content]
-                                reference_important_entities[name] = {'type': plan_type, "description": [content]}
-                    else:
-                        raise Exception("Malformed data.")
-                break  # Exit loop if successful
+                with tracer.span('parse_response', category='cpu'):
+                    response = response.strip().strip('python').strip('\n').strip()
+                    parsed_data = json.loads(response)
+            extracted_names = []
+            for entry in parsed_data:
+                name = entry.get("name")
+                plan_type = entry.get("type")
+                content = entry.get("description")
+                score = entry.get("score")
+
+                if name is not None and plan_type in ENTITY_TYPES and content is not None and score is not None:
+                    name = name.strip()
+                    if score > topic_thd:
+                        extracted_names.append(name)
+                        if name in output:
+                            output[name]['path'].append(path)
+                            output[name]['content'].append(content)
+                            output[name]['score'].append(score)
+                            # Use the last three descriptions to avoid overwhelmed context
+                            reference_important_entities[name]['description'] = output[name]['content'][-3:]
+                        else:
+                            output[name] = {}
+                            output[name]['path'] = [path]
+                            output[name]['content'] = [content]
+                            output[name]['score'] = [score]
+                            reference_important_entities[name] = {'type': plan_type, "description": [content]}
+                else:
+                    raise Exception("Malformed data.")
+            chunk_index.add(text, extracted_names, path)
+            return extracted_names
+        except Exception as e:
+            print(f"WARNING: Failed to process text for {path}: {e}")
+            continue
+    print(f"WARNING: Failed to extract topics for content at {path}.")
+    return None
+
+async def async_summarize_doc_in_topics(file_contents, index, max_topics=20,
+                                        max_input_length=None, max_completion_tokens=None, topic_thd=0, api_key=None,
+                                        chunk_index=None, structured=False, lazy_descriptions=False):
+    """
+    Asynchronously extract topics from already-read file contents.
+
+    Args:
+        file_contents (list): List of (path, contents) of files to extract topics from. Contents may be an
+            awaitable (e.g. a preprocessing future) so extraction can start before every file is cleaned.
+        max_topics (int, optional): Maximum number of topics to extract.
+        max_input_length (int, optional): Maximum input length for the GPT model.
+        max_completion_tokens (int, optional): Maximum tokens for the GPT model's response.
+        topic_thd (float, optional): Threshold for including a topic based on score.
+        api_key (str, required): API key for accessing the GPT API.
+        chunk_index (ChunkDedupIndex, optional): Index of already-extracted contents; repeated contents reuse the
+            earlier result and only add their path. A fresh exact-match index is used if not given.
+        structured (bool, optional): Request schema-constrained JSON at zero temperature and validate it.
+        lazy_descriptions (bool, optional): Skip paragraph descriptions during extraction and generate them in
+            batches only for the topics that are returned.
+
+    Returns:
+        dict: Extracted topics.
+    """
+    reference_important_entities = {}
+    output = {}
+    texts = {}
+    if chunk_index is None:
+        # Whole documents are matched exactly; near-duplicate matching is only safe for chunk-sized text
+        chunk_index = ChunkDedupIndex(exact_only=True)
+
+    for path, text in file_contents:
+        if inspect.isawaitable(text):
+            try:
+                text = await text
+            except FileNotFoundError:
+                print(f"ERROR: File not found - {path}")
+                continue
             except Exception as e:
-                print(f"WARNING: Failed to process text for {path}: {e}")
+                print(f"ERROR: Could not read file {path}: {e}")
                 continue
-        else:
-            print(f"WARNING: Failed to extract topics for content at {path}.")
-            continue
+
+        texts[path] = text
+        await extract_document_topics(path, text, output, reference_important_entities, chunk_index,
+                                      max_topics=max_topics, topic_thd=topic_thd, api_key=api_key,
+                                      structured=structured, describe_entities=not lazy_descriptions)
     
     # Deduplicate topics
     topic_list = list(output.keys())
-
-    print(topic_list)
-
     deduplicated_topics = await clean_top_topics("\n".join(topic_list), api_key)
-    print("AAAAAAAAAAAAAA")
-    print(deduplicated_topics)
 
     # Filter output to include only deduplicated topics
     deduplicated_output = {topic: output[topic] for topic in deduplicated_topics}
 
+    # Only the topics that survived deduplication get a description
+    if lazy_descriptions:
+        await describe_output(TopicDescriber(call_gpt_api), deduplicated_output, texts, api_key)
+
     return deduplicated_output, index
 
 async def main():
     # api_key = ""
 
-    # Read file contents
-    file_contents = []
-    for path in file_paths:
-        try:
-            with open(path, "r") as file:
-                text = file.read()
-                file_contents.append((path, text))
-        except FileNotFoundError:
-            print(f"ERROR: File not found - {path}")
-        except Exception as e:
-            print(f"ERROR: Could not read file {path}: {e}")
+    # Read and clean file contents in worker processes while extraction runs on the event loop
+    with create_executor() as executor:
+        file_contents = [(path, tracer.run_in_executor(executor, 'preprocess', read_and_preprocess_file, path))
+                         for path in file_paths]
 
-    # Start async processing
-    output, index = await async_summarize_doc_in_topics(file_contents, index={}, max_topics=20, topic_thd=0, api_key=api_key)
+        # Start async processing
+        output, index = await async_summarize_doc_in_topics(file_contents, index={}, max_topics=20, topic_thd=0, api_key=api_key)
 
     print("\cleaned Topics:")
     for topic, details in output.items():
@@ -0,0 +1,97 @@
+import json
+
+# json_schema response formats need a model that supports structured outputs.
+STRUCTURED_MODEL = "gpt-4o"
+STRUCTURED_TEMPERATURE = 0
+
+
+def entity_response_format(entity_types):
+    """Response format constraining the model to a list of entity records."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "entities",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "entities": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "type": {"type": "string", "enum": list(entity_types)},
+                                "description": {"type": "string"},
+                                "score": {"type": "number"},
+                            },
+                            "required": ["name", "type", "description", "score"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["entities"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+TOPIC_LIST_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "topics",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"topics": {"type": "array", "items": {"type": "string"}}},
+            "required": ["topics"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def parse_entities(response, entity_types):
+    """
+    Parse and validate a structured entity response.
+
+    Hand-written checks rather than a generic schema validator: the shape is fixed, so a few isinstance calls per
+    record are all that's needed.
+
+    Returns:
+        list: Entity records with "name", "type", "description" and "score".
+
+    Raises:
+        ValueError: If the response doesn't match the schema.
+    """
+    data = json.loads(response)
+    if not isinstance(data, dict) or not isinstance(data.get("entities"), list):
+        raise ValueError("Malformed data: expected an object with an 'entities' list.")
+
+    for entry in data["entities"]:
+        if not isinstance(entry, dict):
+            raise ValueError("Malformed data: entity is not an object.")
+        if not isinstance(entry.get("name"), str) or not isinstance(entry.get("description"), str):
+            raise ValueError("Malformed data: entity name and description must be strings.")
+        if entry.get("type") not in entity_types:
+            raise ValueError(f"Malformed data: unknown entity type {entry.get('type')!r}.")
+        score = entry.get("score")
+        if isinstance(score, bool) or not isinstance(score, (int, float)):
+            raise ValueError("Malformed data: entity score must be a number.")
+    return data["entities"]
+
+
+def parse_topics(response):
+    """
+    Parse and validate a structured topic list response.
+
+    Raises:
+        ValueError: If the response doesn't match the schema.
+    """
+    data = json.loads(response)
+    if not isinstance(data, dict) or not isinstance(data.get("topics"), list):
+        raise ValueError("Malformed data: expected an object with a 'topics' list.")
+    if not all(isinstance(topic, str) for topic in data["topics"]):
+        raise ValueError("Malformed data: topics must be strings.")
+    return [topic.strip() for topic in data["topics"] if topic.strip()]
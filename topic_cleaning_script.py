@@ -1,28 +1,12 @@
-import aiohttp
-import pandas as pd
 from collections import defaultdict
 import asyncio
 
-async def call_gpt_api(prompt, api_key):
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-4-turbo",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,
-    }
+import api_client
+from preprocessing import create_executor, read_topic_table
+from profiling import tracer
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                error = await response.text()
-                raise Exception(f"Error: {response.status}, {error}")
+async def call_gpt_api(prompt, api_key):
+    return await api_client.call_gpt_api(prompt, api_key, model="gpt-4-turbo")
 
 async def process_alphabet(letter, group, topic_content_dict, api_key):
     prompt = f"Go through the entire list and return overly-similar topics. If no over-similar topics are found, or if the list is only one topic long, then return a blank output with no explanations. Only compare one topic with another. Only remove if two topics are extremely similar. For example, topic 1: health savings plan accounts topic 2: health saving accounts. In this case, health savings plan accounts would be removed. Even though these are not exactly identical, they contain very similar semantics. However, they must be VERY similar. If topics are different then do not remove. If topics are specifics of a different topic or under the umbrella of a particular topic, do not remove the specific topics or the other topics that fall under the umbrella. Return in the following format: 'removed_topic', 'topic_that_it_was_similar_to' (only one). Do not include any extra explanations or confirmations.: {group}"
@@ -45,11 +29,14 @@ async def main():
     api_key = "YOUR API KEY HERE"
     # add the file path to your hot topics file here.
     file_path = 'YOUR PATH HERE'
-    df = pd.read_html(file_path)[0]
+    # parsing and cleaning the hot topics file in a worker process
+    with create_executor(max_workers=1) as executor:
+        with tracer.span('read_html'):
+            rows = await tracer.run_in_executor(executor, 'read_html', read_topic_table, file_path)
 
     # creating dictionary from hot topics file
-    topic_content_dict = dict(zip(df['topic'], df['content']))
-    topics = sorted(df['topic'].unique())
+    topic_content_dict = dict(rows)
+    topics = sorted(topic_content_dict)
 
     # splitting alphabetically
     alphabet_groups = defaultdict(list)
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+
+# Characters of context kept around a topic's first mention in a document.
+CONTEXT_WINDOW = 2000
+MAX_CONTEXTS_PER_TOPIC = 2
+# Context characters sent per description call; about 3k tokens, leaving room for the answer within gpt-4's 8k.
+MAX_BATCH_CONTEXT_CHARS = 12000
+
+
+def topic_context(topic, text, window=CONTEXT_WINDOW):
+    """Return the part of `text` around the first mention of `topic`, or its beginning if it isn't mentioned."""
+    position = text.lower().find(topic.lower())
+    if position == -1:
+        return text[:window]
+    start = max(0, position - window // 2)
+    return text[start:start + window]
+
+
+def _context_key(section_text):
+    return hashlib.sha1(section_text.encode('utf-8')).hexdigest()
+
+
+class TopicDescriber:
+    """
+    Lazily generates and memoizes topic descriptions.
+
+    Descriptions are only requested for the topics that survive deduplication and top-k selection, at most
+    `batch_size` topics and `max_context_chars` characters of context per call. Each distinct context section is sent once per batch and referenced by number, so topics that
+    came from the same section share it.
+
+    Args:
+        call_api (callable): Coroutine function taking (prompt, api_key) and returning the response text.
+        batch_size (int, optional): Topics described per API call.
+        max_context_chars (int, optional): Context characters per API call. A topic whose own context is longer
+            still gets a call of its own.
+    """
+
+    def __init__(self, call_api, batch_size=10, max_context_chars=MAX_BATCH_CONTEXT_CHARS):
+        self.call_api = call_api
+        self.batch_size = batch_size
+        self.max_context_chars = max_context_chars
+        self.cache = {}
+
+    def _cache_key(self, topic, sections):
+        return topic, tuple(_context_key(section) for section in sections)
+
+    def _build_prompt(self, batch):
+        section_ids = {}
+        section_texts = []
+        lines = []
+        for topic, sections in batch:
+            ids = []
+            for section in sections:
+                key = _context_key(section)
+                if key not in section_ids:
+                    section_ids[key] = len(section_texts) + 1
+                    section_texts.append(section)
+                ids.append(str(section_ids[key]))
+            lines.append(f"- {topic} (sections: {', '.join(ids)})")
+
+        topic_lines = "\n".join(lines)
+        sections_block = "\n\n".join(f"Section {i}:\n{text}" for i, text in enumerate(section_texts, 1))
+        return (
+            "Generate a concise, medium-sized description of each of the following topics using only the context "
+            "from the sections listed for it. Return a single JSON object mapping each topic name exactly as given "
+            "to its description, with no additional explanations or commentary.\n\n"
+            f"Topics:\n{topic_lines}\n\n{sections_block}"
+        )
+
+    def _batches(self, pending):
+        batches = []
+        batch = []
+        batch_sections = set()
+        batch_chars = 0
+        for topic, sections in pending:
+            new_sections = {_context_key(section): len(section) for section in sections}
+            new_chars = sum(size for key, size in new_sections.items() if key not in batch_sections)
+            if batch and (len(batch) == self.batch_size or batch_chars + new_chars > self.max_context_chars):
+                batches.append(batch)
+                batch = []
+                batch_sections = set()
+                batch_chars = 0
+                new_chars = sum(new_sections.values())
+            batch.append((topic, sections))
+            batch_sections.update(new_sections)
+            batch_chars += new_chars
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _describe_batch(self, batch, api_key):
+        try:
+            response = await self.call_api(self._build_prompt(batch), api_key)
+        except Exception as e:
+            # Leave this batch undescribed rather than failing the run after extraction was paid for
+            print(f"WARNING: Failed to describe topics: {e}")
+            return
+        response = response.strip().strip('`').removeprefix('json').strip()
+        try:
+            descriptions = json.loads(response)
+        except json.JSONDecodeError as e:
+            print(f"WARNING: Failed to parse topic descriptions: {e}")
+            return
+        if not isinstance(descriptions, dict):
+            print("WARNING: Failed to parse topic descriptions: expected a JSON object.")
+            return
+        for topic, sections in batch:
+            description = descriptions.get(topic)
+            if isinstance(description, str) and description.strip():
+                self.cache[self._cache_key(topic, sections)] = description.strip()
+
+    async def describe(self, topics, contexts, api_key):
+        """
+        Describe `topics`, calling the API only for topics not already cached with the same context.
+
+        Topics without any context section, e.g. ones ranked from earlier runs of a topic store, are skipped rather
+        than described by the model from nothing.
+
+        Args:
+            topics (list): Topic names to describe.
+            contexts (dict): Topic name -> list of context sections.
+            api_key (str, required): API key for accessing the GPT API.
+
+        Returns:
+            dict: Topic name -> description, for every topic that could be described.
+        """
+        topics = [topic for topic in dict.fromkeys(topics) if contexts.get(topic)]
+        pending = []
+        for topic in topics:
+            sections = contexts[topic][:MAX_CONTEXTS_PER_TOPIC]
+            if self._cache_key(topic, sections) not in self.cache:
+                pending.append((topic, sections))
+
+        await asyncio.gather(*(self._describe_batch(batch, api_key) for batch in self._batches(pending)))
+
+        descriptions = {}
+        for topic in topics:
+            key = self._cache_key(topic, contexts[topic][:MAX_CONTEXTS_PER_TOPIC])
+            if key in self.cache:
+                descriptions[topic] = self.cache[key]
+        return descriptions
+
+
+async def describe_output(describer, output, texts, api_key, topics=None):
+    """
+    Fill in the descriptions of extracted topics whose extraction skipped them.
+
+    Args:
+        describer (TopicDescriber): Describer to use.
+        output (dict): Topic name -> {'path': [...], 'content': [...]}, updated in place.
+        texts (dict): Path -> document text, used to find each topic's context.
+        api_key (str, required): API key for accessing the GPT API.
+        topics (list, optional): Topics to describe; every topic in `output` if not given.
+    """
+    topics = [topic for topic in (output if topics is None else topics) if topic in output]
+    contexts = {}
+    for topic in topics:
+        paths = [path for path in dict.fromkeys(output[topic]['path']) if path in texts]
+        contexts[topic] = [topic_context(topic, texts[path]) for path in paths[:MAX_CONTEXTS_PER_TOPIC]]
+    descriptions = await describer.describe(topics, contexts, api_key)
+    for topic, description in descriptions.items():
+        output[topic]['content'] = [description]
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import importlib
+import os
+from functools import partial
+
+import api_client
+from chunk_dedup import ChunkDedupIndex
+from pipeline import Pipeline, Stage
+from preprocessing import clean_document, create_executor, split_document_into_chunks
+from topic_descriptions import MAX_CONTEXTS_PER_TOPIC, TopicDescriber, describe_output
+from topic_store import RANKINGS, TopicStore
+
+# Approach -> script module, imported only when the approach is used
+APPROACHES = {
+    'standard_standalone': 'standard_standalone',
+    'standard_with_cleaning': 'standard_with_cleaning',
+    'optimized_no_cleaning': 'optimized_approach_no_cleaning',
+    'optimized_with_cleaning': 'optimized_approach_with_cleaning',
+}
+
+
+def read_document(path):
+    """Read stage: returns [(path, text)], or nothing if the file can't be read."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return [(path, file.read())]
+    except FileNotFoundError:
+        print(f"ERROR: File not found - {path}")
+    except Exception as e:
+        print(f"ERROR: Could not read file {path}: {e}")
+    return []
+
+
+def preprocess_item(item):
+    path, text = item
+    return path, clean_document(text)
+
+
+def chunk_item(item, chunk_size=2000):
+    path, text = item
+    return [(path, section) for section in split_document_into_chunks(text, chunk_size=chunk_size)]
+
+
+async def rank_with_store(store, top_k, rank_by, clean_topics, topics, descriptions_pending=False):
+    """
+    Rank stage backed by the global topic store: merge this run's topics, then rank the whole corpus locally.
+
+    The store is saved right away so a failure in a later stage doesn't lose the run. With `descriptions_pending`,
+    the placeholder descriptions from extraction are left out; save_to_store adds the generated ones.
+
+    `clean_topics`, if given, is a coroutine function returning the names of `topics` to keep after dropping
+    overly-similar ones. Every topic is still merged into the store; the dropped ones are only left out of this
+    ranking, and a blank or unrecognised response drops nothing.
+    """
+    if descriptions_pending:
+        topics_to_merge = {name: {key: value for key, value in details.items() if key != 'content'}
+                           for name, details in topics.items()}
+    else:
+        topics_to_merge = topics
+    store.merge(topics_to_merge)
+    if store.path is not None:
+        store.save()
+
+    names = None
+    if clean_topics is not None:
+        kept = {topic for topic in await clean_topics(topics) if topic in topics}
+        if kept:
+            names = [name for name in store.topics if name not in topics or name in kept]
+    # All of this run's topics are returned, as save_to_store merges them again
+    return {'topics': topics, 'top_topics': store.top(top_k, by=rank_by, names=names)}
+
+
+async def _clean_topic_names(module, api_key, topics):
+    return await module.clean_top_topics("\n".join(topics), api_key)
+
+
+def save_to_store(store, result):
+    """Final stage after describing: merge the described topics into the store and save it."""
+    # Merging a path again replaces its counts, so the topics merged for ranking aren't counted twice
+    store.merge(result['topics'])
+    if store.path is not None:
+        store.save()
+    return result
+
+
+def _optimized_stages(module, api_key, executor, extract_workers, chunk_size, clean, structured):
+    chunk_index = ChunkDedupIndex()
+    describer = TopicDescriber(module.call_gpt_api)
+    contexts = {}
+
+    async def extract(item):
+        path, section_text = item
+
+        async def extract_section():
+            topics = await module.extract_topics(section_text, api_key, structured=structured)
+            for topic in topics:
+                sections = contexts.setdefault(topic, [])
+                if len(sections) < MAX_CONTEXTS_PER_TOPIC:
+                    sections.append(section_text)
+            return topics
+
+        # Extract workers run concurrently, so duplicates in flight together share one call
+        return path, await chunk_index.get_or_extract(section_text, extract_section, path)
+
+    def merge(items):
+        topic_dict = {}
+        for path, topics in items:
+            for topic in topics:
+                if topic not in topic_dict:
+                    topic_dict[topic] = {'path': []}
+                if path not in topic_dict[topic]['path']:
+                    topic_dict[topic]['path'].append(path)
+        return topic_dict
+
+    async def dedup(topic_dict):
+        cleaned_topics = await module.clean_top_topics("\n".join(topic_dict), api_key)
+        return {topic: topic_dict.get(topic, {'path': []}) for topic in cleaned_topics}
+
+    async def rank(topic_dict):
+        top_topics = await module.extract_top_topics("\n".join(topic_dict), api_key)
+        return {'topics': topic_dict, 'top_topics': top_topics}
+
+    stages = [
+        Stage('read', read_document, kind='flat_map'),
+        Stage('preprocess', preprocess_item, executor=executor, workers=2),
+        Stage('chunk', partial(chunk_item, chunk_size=chunk_size), kind='flat_map', executor=executor),
+        Stage('extract', extract, workers=extract_workers),
+        Stage('merge', merge, kind='reduce'),
+    ]
+    if clean:
+        stages.append(Stage('dedup', dedup))
+    stages.append(Stage('rank', rank))
+
+    async def describe(result):
+        result['descriptions'] = await describer.describe(result['top_topics'], contexts, api_key)
+        for topic, description in result['descriptions'].items():
+            if topic in result['topics']:
+                result['topics'][topic]['content'] = [description]
+        return result
+
+    return stages, describe
+
+
+def _standard_stages(module, api_key, executor, max_topics, topic_thd, clean, structured, describe_topics,
+                     ranked_by_store):
+    output = {}
+    reference_important_entities = {}
+    # Extraction works on whole documents, which are only deduplicated when they match exactly
+    chunk_index = ChunkDedupIndex(exact_only=True)
+    describer = TopicDescriber(module.call_gpt_api)
+    texts = {}
+
+    async def extract(item):
+        path, text = item
+        texts[path] = text
+        names = await module.extract_document_topics(path, text, output, reference_important_entities, chunk_index,
+                                                     max_topics=max_topics, topic_thd=topic_thd, api_key=api_key,
+                                                     structured=structured, describe_entities=not describe_topics)
+        return path, names or []
+
+    def merge(items):
+        # Extraction already merged each document into `output` so later documents see it as reference
+        return output
+
+    async def dedup(topics):
+        deduplicated_topics = await module.clean_top_topics("\n".join(topics), api_key)
+        return {topic: topics[topic] for topic in deduplicated_topics if topic in topics}
+
+    stages = [
+        Stage('read', read_document, kind='flat_map'),
+        Stage('preprocess', preprocess_item, executor=executor, workers=2),
+        # Reference entities carry over from one document to the next, so extraction is sequential
+        Stage('extract', extract, workers=1),
+        Stage('merge', merge, kind='reduce'),
+    ]
+    if clean:
+        stages.append(Stage('dedup', dedup))
+
+    async def describe(result):
+        if ranked_by_store:
+            await describe_output(describer, result['topics'], texts, api_key, topics=result['top_topics'])
+        else:
+            await describe_output(describer, result, texts, api_key)
+        return result
+
+    return stages, describe
+
+
+def build_pipeline(approach, api_key, executor=None, extract_workers=4, chunk_size=2000, max_topics=20, topic_thd=0,
+                   maxsize=8, structured=False, store=None, top_k=25, rank_by='frequency', describe_topics=False):
+    """
+    Express one of the four approaches as a read -> preprocess -> chunk -> extract -> merge -> dedup -> rank pipeline.
+
+    Args:
+        approach (str): One of APPROACHES.
+        api_key (str): API key for accessing the GPT API.
+        executor (Executor, optional): Process pool for CPU-bound preprocessing.
+        extract_workers (int, optional): Concurrent extraction calls for the optimized approaches.
+        chunk_size (int, optional): Chunk size for the optimized approaches.
+        max_topics (int, optional): Maximum number of topics per document for the standard approaches.
+        topic_thd (float, optional): Score threshold for the standard approaches.
+        maxsize (int, optional): Items buffered between stages before upstream stages wait.
+        structured (bool, optional): Use schema-constrained, zero-temperature extraction.
+        store (TopicStore, optional): Global topic store to merge into. When given, the top `top_k` topics are ranked
+            locally over the whole store by `rank_by` instead of with an LLM call. With cleaning, every topic is
+            merged into the store and the cleaned list only filters the ranking.
+        describe_topics (bool, optional): Generate descriptions lazily, in batches, only for the topics that survive
+            deduplication and top-k selection. The standard approaches then skip paragraph descriptions during
+            extraction. With a store, the store is saved after describing so it keeps the generated descriptions.
+
+    Returns:
+        Pipeline: Pipeline that takes file paths.
+    """
+    module = importlib.import_module(APPROACHES[approach])
+    clean = approach.endswith('with_cleaning')
+    # With a store, cleaning moves into the rank stage so the store still gets every extracted topic
+    dedup_stage = clean and store is None
+    if approach.startswith('optimized'):
+        stages, describe = _optimized_stages(module, api_key, executor, extract_workers, chunk_size, dedup_stage,
+                                             structured)
+    else:
+        stages, describe = _standard_stages(module, api_key, executor, max_topics, topic_thd, dedup_stage,
+                                            structured, describe_topics, store is not None)
+    if store is not None:
+        if approach.startswith('optimized'):
+            stages.pop()  # Drop the LLM rank stage
+        clean_topics = partial(_clean_topic_names, module, api_key) if clean else None
+        stages.append(Stage('rank', partial(rank_with_store, store, top_k, rank_by, clean_topics,
+                                            descriptions_pending=describe_topics)))
+    if describe_topics:
+        stages.append(Stage('describe', describe))
+        if store is not None:
+            stages.append(Stage('store', partial(save_to_store, store)))
+    return Pipeline(stages, maxsize=maxsize)
+
+
+async def run_approach(approach, file_paths, api_key, **options):
+    """Run an approach over `file_paths` and return the output of its last stage."""
+    with create_executor() as executor:
+        async with api_client.shared_session():
+            pipeline = build_pipeline(approach, api_key, executor=executor, **options)
+            results = await pipeline.run(file_paths)
+    return results[0]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Extract topics with one of the four approaches.")
+    parser.add_argument('approach', choices=sorted(APPROACHES))
+    parser.add_argument('file_paths', nargs='+')
+    parser.add_argument('--extract-workers', type=int, default=4)
+    parser.add_argument('--structured', action='store_true', help="Schema-constrained, zero-temperature output.")
+    parser.add_argument('--store', help="Global topic store to merge into and rank from.")
+    parser.add_argument('--rank-by', choices=RANKINGS, default='frequency')
+    parser.add_argument('--describe', action='store_true', help="Describe the surviving topics.")
+    args = parser.parse_args()
+
+    # API key for OpenAI
+    api_key = os.environ.get("OPENAI_API_KEY")
+    store = TopicStore(args.store) if args.store else None
+    result = await run_approach(args.approach, args.file_paths, api_key, extract_workers=args.extract_workers,
+                                structured=args.structured, store=store, rank_by=args.rank_by,
+                                describe_topics=args.describe)
+
+    if args.approach.startswith('optimized') or store is not None:
+        print("\nTop 25 overarching topics:")
+        for topic in result['top_topics']:
+            print(topic)
+        for topic, description in result.get('descriptions', {}).items():
+            print(f"{topic}: {description}")
+    else:
+        print("\nExtracted Topics:")
+        for topic in result:
+            print(topic)
+
+    print(f"\nAPI concurrency: {api_client.limiter.metrics()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
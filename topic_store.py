@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+from collections import Counter
+
+# Mirrors extraction, which keeps the last three descriptions as reference context.
+MAX_DESCRIPTIONS = 3
+RANKINGS = ('frequency', 'score')
+
+
+class TopicStore:
+    """
+    Persistent cross-run topic index.
+
+    For every topic the store keeps how often it was extracted from each source path, the best relevance score seen
+    and a few representative descriptions. Runs merge their output in incrementally; re-merging the output
+    for a path replaces that path's counts rather than adding to them, and drops the path from topics it no longer
+    yields, so reprocessing a document is idempotent.
+    Rankings are computed locally, without an LLM call.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.topics = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.topics = json.load(file)["topics"]
+
+    def merge(self, output):
+        """
+        Merge a run's topics into the store.
+
+        `output` is taken as the complete result for every path it mentions: topics that are missing from it lose
+        their counts for those paths, and are removed once they have no paths left.
+
+        Args:
+            output (dict): Topic name -> {'path': [...], 'content': [...] (optional), 'score': [...] (optional)}, as
+                produced by async_summarize_doc_in_topics or the optimized scripts. Frequencies are only
+                comparable across runs if every source lists a path once per file the topic was found in.
+        """
+        merged_paths = {path for details in output.values() for path in details.get('path', [])}
+        for name in [name for name in self.topics if name not in output]:
+            paths = self.topics[name]['paths']
+            stale = merged_paths.intersection(paths)
+            for path in stale:
+                del paths[path]
+            if stale and not paths:
+                del self.topics[name]
+
+        for name, details in output.items():
+            entry = self.topics.setdefault(name, {'paths': {}, 'score': None, 'descriptions': []})
+            entry['paths'].update(Counter(details.get('path', [])))
+
+            scores = details.get('score', [])
+            if scores:
+                entry['score'] = max(max(scores), entry['score'] or 0)
+
+            for content in details.get('content', []):
+                if content not in entry['descriptions']:
+                    entry['descriptions'].append(content)
+            entry['descriptions'] = entry['descriptions'][-MAX_DESCRIPTIONS:]
+
+    def merge_store(self, other):
+        """Merge another store, e.g. a worker's partial index, into this one."""
+        self.merge({
+            name: {
+                'path': [path for path, count in entry['paths'].items() for _ in range(count)],
+                'score': [entry['score']] if entry['score'] is not None else [],
+                'content': entry['descriptions'],
+            }
+            for name, entry in other.topics.items()
+        })
+
+    def frequency(self, name):
+        return sum(self.topics[name]['paths'].values())
+
+    def weighted_score(self, name):
+        """Mentions weighted by the best relevance score seen; unscored topics count fully."""
+        score = self.topics[name]['score']
+        return self.frequency(name) * (1.0 if score is None else score)
+
+    def top(self, k=25, by='frequency', names=None):
+        """Return the `k` highest-ranked topic names, out of `names` if given."""
+        if by == 'frequency':
+            key = self.frequency
+        elif by == 'score':
+            key = self.weighted_score
+        else:
+            raise ValueError(f"Unknown ranking: {by}")
+        names = self.topics if names is None else [name for name in dict.fromkeys(names) if name in self.topics]
+        return sorted(names, key=lambda name: (-key(name), name))[:k]
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the topic store to.")
+        # Write to a temporary file first so an interrupted run never leaves a truncated store behind
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({'topics': self.topics}, file)
+        os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the global topic store.")
+    parser.add_argument('store_path')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--by', choices=RANKINGS, default='frequency')
+    args = parser.parse_args()
+
+    store = TopicStore(args.store_path)
+    print(f"Top {args.top} topics by {args.by}:")
+    for topic in store.top(args.top, by=args.by):
+        print(topic)
+
+if __name__ == "__main__":
+    main()
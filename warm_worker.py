@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import stat
+import sys
+
+import api_client
+from chunk_dedup import ChunkDedupIndex
+from preprocessing import clean_document, create_executor, preprocess_document, read_and_preprocess_file
+from profiling import tracer
+from topic_store import TopicStore
+
+APPROACH_MODULES = {'standard': 'standard_standalone', 'optimized': 'optimized_approach_no_cleaning'}
+# Longest request line accepted; inline "text" documents easily exceed asyncio's 64 KiB default
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# Chunks remembered per approach; the least recently seen are evicted so a long-lived worker stays bounded
+MAX_CACHED_CHUNKS = 10000
+# Seconds results wait to be saved to the store, so a burst of requests is written once
+STORE_SAVE_DELAY = 5.0
+
+
+class WarmWorker:
+    """
+    Long-running extraction worker for per-document jobs.
+
+    The interpreter, event loop, HTTP connection pool, preprocessing process pool, script modules and chunk caches
+    stay alive between documents, so a small document costs about one API round trip instead of a full startup.
+
+    Requests are JSON objects, one per line:
+        {"id": ..., "path": <file> or "text": <contents>, "approach": "optimized" | "standard", "structured": false}
+    Responses are one JSON object per line with the request "id" and either "topics" (topic name -> details, as in
+    the scripts' output) or "error".
+
+    Args:
+        api_key (str, required): API key for accessing the GPT API.
+        executor (Executor): Process pool for preprocessing.
+        store_path (str, optional): Global topic store every result is merged into. Results are saved in batches,
+            off the event loop, at most STORE_SAVE_DELAY seconds after they complete; call flush before exiting.
+            Each save reloads the store first, so merges by other runs (pipeline --store, sharding reduce) are kept
+            unless they land between that reload and the write.
+        max_cached_chunks (int, optional): Chunks remembered per approach for deduplication.
+    """
+
+    def __init__(self, api_key, executor, store_path=None, max_cached_chunks=MAX_CACHED_CHUNKS):
+        self.api_key = api_key
+        self.executor = executor
+        self.store_path = store_path
+        self._unsaved = []
+        self._save_task = None
+        self._save_lock = asyncio.Lock()
+        self.modules = {approach: importlib.import_module(name) for approach, name in APPROACH_MODULES.items()}
+        # One index per approach: results are section topic lists for one and document outputs for the other
+        # Standard results are whole documents, which are only reused when they match exactly
+        self.chunk_indexes = {
+            approach: ChunkDedupIndex(max_entries=max_cached_chunks, exact_only=approach == 'standard')
+            for approach in APPROACH_MODULES
+        }
+
+    async def _extract_section(self, module, section_text, structured):
+        # Sections of one document, and of concurrent requests, are extracted together; duplicates share one call.
+        # No path is attached: the worker never reads entries' paths, which would grow for every repeat.
+        return await self.chunk_indexes['optimized'].get_or_extract(
+            section_text, lambda: module.extract_topics(section_text, self.api_key, structured=structured)
+        )
+
+    async def extract(self, path, text, approach='optimized', structured=False):
+        module = self.modules[approach]
+
+        if approach == 'optimized':
+            if text is None:
+                sections = await tracer.run_in_executor(self.executor, 'preprocess', read_and_preprocess_file, path,
+                                                        2000)
+            else:
+                sections = await tracer.run_in_executor(self.executor, 'preprocess', preprocess_document, text, 2000)
+            results = await asyncio.gather(
+                *(self._extract_section(module, section_text, structured) for section_text in sections)
+            )
+            output = {}
+            for topics in results:
+                for topic in topics:
+                    # Count each topic once per document, like the pipeline's merge stage
+                    output.setdefault(topic, {'path': [path]})
+            return output
+
+        if text is None:
+            text = await tracer.run_in_executor(self.executor, 'preprocess', read_and_preprocess_file, path)
+        else:
+            text = await tracer.run_in_executor(self.executor, 'preprocess', clean_document, text)
+
+        async def extract_document():
+            output = {}
+            # A throwaway index: repeats are caught by the worker's index, with the whole output as the cached result
+            names = await module.extract_document_topics(path, text, output, {}, ChunkDedupIndex(),
+                                                         api_key=self.api_key, structured=structured)
+            if names is None:
+                raise Exception("Failed to extract topics.")
+            return output
+
+        result = await self.chunk_indexes['standard'].get_or_extract(text, extract_document)
+        return {name: dict(details, path=[path]) for name, details in result.items()}
+
+    async def handle(self, line):
+        request = None
+        try:
+            request = json.loads(line)
+            path = request.get('path') or str(request.get('id'))
+            output = await self.extract(path, request.get('text'), approach=request.get('approach', 'optimized'),
+                                        structured=request.get('structured', False))
+        except Exception as e:
+            return {'id': request.get('id') if isinstance(request, dict) else None, 'error': str(e)}
+
+        if self.store_path is not None:
+            self._unsaved.append(output)
+            if self._save_task is None or self._save_task.done():
+                self._save_task = asyncio.create_task(self._save_store(STORE_SAVE_DELAY))
+        return {'id': request.get('id'), 'topics': output}
+
+    def _write_store(self, outputs):
+        # Reload so merges made by other runs since the last save aren't overwritten
+        store = TopicStore(self.store_path)
+        for output in outputs:
+            store.merge(output)
+        store.save()
+
+    async def _save_store(self, delay):
+        await asyncio.sleep(delay)
+        async with self._save_lock:
+            outputs, self._unsaved = self._unsaved, []
+            if not outputs:
+                return
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write_store, outputs)
+            except Exception as e:
+                print(f"WARNING: Failed to save the topic store: {e}", file=sys.stderr)
+                # Keep the results for the next save
+                self._unsaved = outputs + self._unsaved
+
+    async def flush(self):
+        """Save results that are still waiting for the store."""
+        await self._save_store(0)
+
+
+async def read_request(reader):
+    """
+    Read the next request line.
+
+    Returns:
+        bytes: The line, or b'' at the end of input. None if the line was longer than the reader's limit; the rest
+            of it is skipped.
+    """
+    too_long = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            # Drop what was buffered of the long line and keep reading up to its end
+            await reader.readexactly(e.consumed)
+            too_long = True
+            continue
+        return None if too_long else line
+
+
+def _too_long_response():
+    return {'id': None, 'error': f"Request is longer than {MAX_REQUEST_BYTES} bytes."}
+
+
+async def _feed_from_file(reader, file):
+    # Regular files can't be watched by the event loop, so read them in a thread
+    loop = asyncio.get_running_loop()
+    while data := await loop.run_in_executor(None, file.read1, 1 << 16):
+        reader.feed_data(data)
+    reader.feed_eof()
+
+
+async def serve_stdin(worker, out):
+    """Read JSONL requests from stdin and write responses to `out` as they complete."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_REQUEST_BYTES)
+    feeder = None
+    if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+        # e.g. `python warm_worker.py < requests.jsonl`
+        feeder = asyncio.create_task(_feed_from_file(reader, sys.stdin.buffer))
+    else:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    def write(response):
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+
+    async def respond(line):
+        write(await worker.handle(line))
+
+    tasks = set()
+    while (line := await read_request(reader)) != b"":
+        if line is None:
+            write(_too_long_response())
+        elif line.strip():
+            task = asyncio.create_task(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    if feeder is not None:
+        await feeder
+
+
+async def serve_socket(worker, socket_path):
+    """Serve JSONL requests on a Unix socket; each connection can send any number of requests."""
+    async def handle_connection(reader, writer):
+        lock = asyncio.Lock()
+
+        async def respond(line):
+            response = await worker.handle(line)
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode('utf-8'))
+                await writer.drain()
+
+        async def reject():
+            async with lock:
+                writer.write((json.dumps(_too_long_response()) + "\n").encode('utf-8'))
+                await writer.drain()
+
+        tasks = []
+        while (line := await read_request(reader)) != b"":
+            if line is None:
+                tasks.append(asyncio.create_task(reject()))
+            elif line.strip():
+                tasks.append(asyncio.create_task(respond(line)))
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle_connection, path=socket_path, limit=MAX_REQUEST_BYTES)
+    print(f"Listening on {socket_path}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Long-running topic extraction worker.")
+    parser.add_argument('--socket', help="Serve on this Unix socket instead of stdin/stdout.")
+    parser.add_argument('--store', help="Global topic store to merge every result into.")
+    parser.add_argument('--max-cached-chunks', type=int, default=MAX_CACHED_CHUNKS,
+                        help="Chunks remembered per approach for deduplication.")
+    args = parser.parse_args()
+
+    # API key for OpenAI
+    api_key = os.environ.get("OPENAI_API_KEY")
+    out = sys.stdout
+
+    # Workers are started on demand; forked ones would inherit open client sockets and keep connections from closing
+    with create_executor(start_method='forkserver') as executor:
+        async with api_client.shared_session():
+            worker = WarmWorker(api_key, executor, store_path=args.store, max_cached_chunks=args.max_cached_chunks)
+            try:
+                if args.socket:
+                    await serve_socket(worker, args.socket)
+                else:
+                    # stdout carries responses; the scripts' progress and warning prints go to stderr
+                    with contextlib.redirect_stdout(sys.stderr):
+                        await serve_stdin(worker, out)
+            finally:
+                await worker.flush()
+
+if __name__ == "__main__":
+    asyncio.run(main())